@@ -1,21 +1,31 @@
+import uuid
 import time
 import math
+from pathlib import Path
+import numpy as np
 import requests
+import certifi
+import orjson
 import pandas as pd
 import streamlit as st
-import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+from requests.adapters import HTTPAdapter
 from streamlit_autorefresh import st_autorefresh
 
 # -----------------------------
 # Dr. FixIT Wind Chill Formula
 # -----------------------------
 def wind_chill(temp_c, wind_kmh):
-    if temp_c > 10 or wind_kmh < 4.8:
-        return temp_c
-    v = wind_kmh ** 0.16
-    return 13.12 + 0.6215*temp_c - 11.37*v + 0.3965*temp_c*v
+    t = np.asarray(temp_c, dtype=float)
+    w = np.asarray(wind_kmh, dtype=float)
+    # 13.12 + 0.6215T + V^0.16 (0.3965T - 11.37), computed in place
+    wc = np.power(w, 0.16)
+    wc *= 0.3965*t - 11.37
+    wc += 0.6215*t + 13.12
+    out = np.where((t > 10) | (w < 4.8), t, wc)
+    # Behave like a ufunc: arrays in, array out; scalars in, float out
+    return out if out.ndim else out.item()
 
 # -----------------------------
 # Page Config
@@ -57,13 +67,25 @@ CITIES = {
     "Voss": (60.623, 6.419),
 }
 
+CITIES_SORTED = sorted(CITIES)
+DEFAULT_CITIES = list(CITIES)
+
+# (lat, lon) rows in CITIES order, indexed by CITY_IDX for the selected cities
+CITY_COORDS = np.array(list(CITIES.values()))
+CITY_IDX = {name: i for i, name in enumerate(CITIES)}
+
+# Cold Meter bar colours: <= -20, <= 0, above 0
+GAUGE_THRESHOLDS = np.array([-20, 0])
+GAUGE_PALETTE = np.array(['#0d3b66', '#3f88c5', '#f4d35e'])
+
 # -----------------------------
 # Sidebar
 # -----------------------------
 st.sidebar.header("⚙️ Settings")
-multi_cities = st.sidebar.multiselect("Select cities", sorted(CITIES.keys()), default=["Oslo", "Bergen","Trondheim","Stavanger","Kristiansand","Drammen","Sandnes","Fredrikstad","Tromsø","Lillestrøm","Sarpsborg","Skien","Sandefjord","Haugesund","Moss","Porsgrunn","Bodø","Arendal","Hamar","Ålesund","Mo i Rana","Narvik","Alta","Molde","Notodden","Levanger","Namsos","Voss"])
+multi_cities = st.sidebar.multiselect("Select cities", CITIES_SORTED, default=DEFAULT_CITIES)
 hours = st.sidebar.slider("Forecast hours", 12, 72, 24)
 refresh = st.sidebar.slider("Auto-refresh interval (sec)", 30, 600, 60)
+animate = st.sidebar.checkbox("Animate playback", value=False)
 speed = st.sidebar.slider("Animation speed (seconds per hour)", 0.2, 2.0, 0.5)
 alert_threshold = st.sidebar.number_input("Extreme cold threshold (°C)", value=-20)
 st_autorefresh(interval=refresh*1000, key="refresh")
@@ -80,31 +102,131 @@ def go_to_page(page_name):
 # -----------------------------
 # Fetch Forecast
 # -----------------------------
-@st.cache_data(ttl=900)
-def fetch_forecast(lat, lon):
-    url = (f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}"
-           "&hourly=temperature_2m,windspeed_10m&timezone=auto")
-    r = requests.get(url, timeout=15, verify=False)
-    r.raise_for_status()
-    return r.json()
+# Shared across reruns so the forecast request reuses a pooled connection
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    session.verify = certifi.where()
+    session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+    return session
 
-city_dfs = {}
-for city in multi_cities:
-    lat, lon = CITIES[city]
+# On-disk copy of each location's forecast JSON so restarted workers start
+# warm; one file per (lat, lon) lets any selection of cities reuse it
+FORECAST_TTL = 900
+CACHE_DIR = Path(__file__).parent / ".cache" / "forecast"
+
+def cache_path(lat, lon):
+    return CACHE_DIR / f"{lat}_{lon}.json"
+
+def disk_cache_stamp(lats, lons):
+    # Write times of the fresh files (None when missing or expired). Passed
+    # into the cached functions below so an in-memory entry can never
+    # outlive the disk copies it was built from.
+    now = time.time()
+    stamp = []
+    for lat, lon in zip(lats, lons):
+        try:
+            mtime = cache_path(lat, lon).stat().st_mtime
+        except OSError:
+            mtime = None
+        stamp.append(mtime if mtime is not None and now - mtime < FORECAST_TTL else None)
+    return tuple(stamp)
+
+def read_disk_cache(lat, lon):
+    path = cache_path(lat, lon)
     try:
-        data = fetch_forecast(lat, lon)
+        if time.time() - path.stat().st_mtime < FORECAST_TTL:
+            return orjson.loads(path.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        pass
+    return None
+
+def write_disk_cache(forecasts):
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        for (lat, lon), data in forecasts.items():
+            tmp = CACHE_DIR / f"{uuid.uuid4().hex}.tmp"
+            tmp.write_bytes(orjson.dumps(data))
+            tmp.replace(cache_path(lat, lon))
+        # Anything past the TTL is dead weight: expired forecasts and temp
+        # files orphaned by an interrupted write
+        now = time.time()
+        for path in CACHE_DIR.iterdir():
+            try:
+                if now - path.stat().st_mtime >= FORECAST_TTL:
+                    path.unlink()
+            except OSError:
+                pass
+    except OSError:
+        pass
+
+@st.cache_data(ttl=FORECAST_TTL)
+def fetch_forecast_batch(lats, lons, stamp):
+    # stamp is only part of the cache key, see disk_cache_stamp()
+    forecasts = {(lat, lon): read_disk_cache(lat, lon) for lat, lon in zip(lats, lons)}
+    missing = [coord for coord, data in forecasts.items() if data is None]
+    if missing:
+        # One request for every city not on disk; Open-Meteo returns the
+        # forecasts in request order
+        url = (f"https://api.open-meteo.com/v1/forecast?latitude={','.join(str(lat) for lat, _ in missing)}"
+               f"&longitude={','.join(str(lon) for _, lon in missing)}"
+               "&hourly=temperature_2m,windspeed_10m&timezone=auto")
+        try:
+            r = get_session().get(url, timeout=15)
+        except requests.exceptions.SSLError:
+            r = get_session().get(url, timeout=15, verify=False)
+        r.raise_for_status()
+        data = orjson.loads(r.content)
+        # A single location comes back as a bare object rather than a list
+        fetched = dict(zip(missing, data if isinstance(data, list) else [data]))
+        write_disk_cache(fetched)
+        forecasts.update(fetched)
+    return list(forecasts.values())
+
+@st.cache_data(ttl=FORECAST_TTL)
+def forecast_dfs(lats, lons, hours, stamp):
+    # Derived frames are cached too, so widget-only reruns (threshold, speed,
+    # page changes) skip the DataFrame and wind chill work entirely
+    frames = []
+    for data in fetch_forecast_batch(lats, lons, stamp):
         df = pd.DataFrame({
-            "Time": data["hourly"]["time"][:hours],
+            "Time": pd.to_datetime(data["hourly"]["time"][:hours]),
             "Temperature (°C)": data["hourly"]["temperature_2m"][:hours],
             "Wind Speed (km/h)": data["hourly"]["windspeed_10m"][:hours]
         })
-        df["Wind Chill (°C)"] = df.apply(
-            lambda r: wind_chill(r["Temperature (°C)"], r["Wind Speed (km/h)"]),
-            axis=1
+        df["Wind Chill (°C)"] = wind_chill(
+            df["Temperature (°C)"].to_numpy(),
+            df["Wind Speed (km/h)"].to_numpy()
         )
-        city_dfs[city] = df
+        frames.append(df)
+    return frames
+
+city_dfs = {}
+if multi_cities:
+    # Sorted so the in-memory cache key ignores selection order
+    selected = sorted(multi_cities)
+    selected_lats = tuple(CITIES[c][0] for c in selected)
+    selected_lons = tuple(CITIES[c][1] for c in selected)
+    try:
+        city_dfs = dict(zip(selected, forecast_dfs(
+            selected_lats,
+            selected_lons,
+            hours,
+            disk_cache_stamp(selected_lats, selected_lons)
+        )))
     except Exception as e:
-        st.error(f"Failed to fetch {city}: {e}")
+        st.error(f"Failed to fetch forecasts: {e}")
+        # Nothing below can render without the forecasts
+        st.stop()
+
+# Cities x hours matrices and coordinate vectors, so the dashboards index
+# plain arrays instead of doing per-city Series lookups every frame
+if city_dfs:
+    t_mat = np.vstack([city_dfs[c]["Temperature (°C)"].to_numpy() for c in multi_cities])
+    wc_mat = np.vstack([city_dfs[c]["Wind Chill (°C)"].to_numpy() for c in multi_cities])
+else:
+    t_mat = wc_mat = np.empty((0, hours))
+lats, lons = CITY_COORDS[np.array([CITY_IDX[c] for c in multi_cities], dtype=np.intp)].T
 
 # -----------------------------
 # Home Page
@@ -118,10 +240,9 @@ if st.session_state.page == "Home":
         latest_hour = hours-1
         leaderboard_df = pd.DataFrame({
             "City": multi_cities,
-            "Temperature (°C)": [city_dfs[c]["Temperature (°C)"].iloc[latest_hour] for c in multi_cities],
-            "Wind Chill (°C)": [city_dfs[c]["Wind Chill (°C)"].iloc[latest_hour] for c in multi_cities]
-        })
-        leaderboard_df = leaderboard_df.sort_values(by="Wind Chill (°C)")
+            "Temperature (°C)": t_mat[:, latest_hour],
+            "Wind Chill (°C)": wc_mat[:, latest_hour]
+        }).sort_values(by="Wind Chill (°C)")
 
         st.subheader("🏆 Coldest Cities Leaderboard")
         st.dataframe(
@@ -143,133 +264,225 @@ if st.session_state.page == "Home":
 # Multi-page Dashboards
 # -----------------------------
 elif multi_cities and st.session_state.page in ["Multi-city","Heatmap","Cold Meter","City Map"]:
-    placeholder_graph = st.empty()
-    placeholder_heatmap = st.empty()
-    placeholder_gauge = st.empty()
-    placeholder_map = st.empty()
-    placeholder_tables = st.empty()
-
-    for hour_idx in range(hours):
-
-        if st.session_state.page == "Multi-city":
-            compare_df = pd.DataFrame()
-            for city in multi_cities:
-                df = city_dfs[city][["Time","Temperature (°C)","Wind Chill (°C)"]].iloc[:hour_idx+1]
-                df = df.rename(columns={
-                    "Temperature (°C)": f"{city} Temp",
-                    "Wind Chill (°C)": f"{city} Wind Chill"
-                })
-                compare_df = df if compare_df.empty else compare_df.merge(df,on="Time")
-            if not compare_df.empty:
-                fig_graph = px.line(
-                    compare_df,
-                    x="Time",
-                    y=compare_df.columns[1:],
-                    labels={"value":"°C","variable":"Metric"},
-                    title=f"Temperature & Wind Chill – Hour {hour_idx+1}"
-                )
-                placeholder_graph.plotly_chart(fig_graph, use_container_width=True)
-
-        if st.session_state.page == "Heatmap":
-            z = pd.DataFrame({
-                city: city_dfs[city]["Wind Chill (°C)"].iloc[:hour_idx+1]
-                for city in multi_cities
-            })
-            fig_heatmap = px.imshow(
-                z.T,
-                labels=dict(x="Hour",y="City",color="Wind Chill (°C)"),
-                x=[f"H{h+1}" for h in range(hour_idx+1)],
-                y=multi_cities,
-                color_continuous_scale="RdBu_r",
-                aspect="auto"
-            )
-            placeholder_heatmap.plotly_chart(fig_heatmap, use_container_width=True)
-
-        if st.session_state.page == "Cold Meter":
-            n = len(multi_cities)
-            cols = 3
-            rows = (n+cols-1)//cols
-            fig_gauge = make_subplots(
-                rows=rows,
-                cols=cols,
-                specs=[[{"type":"indicator"}]*cols]*rows,
-                subplot_titles=multi_cities
-            )
+    # Every dashboard is animated in the browser: each figure carries one
+    # Plotly frame per hour and the Play button / slider step through them,
+    # so the script renders once instead of redrawing and sleeping per hour.
+    # Without playback only the final hour is drawn.
+    last_hour = hours-1
+    hour_labels = [f"H{h+1}" for h in range(hours)]
+    frame_args = {
+        "frame": {"duration": int(speed*1000), "redraw": True},
+        "transition": {"duration": 0},
+        "mode": "immediate"
+    }
 
-            for idx, city in enumerate(multi_cities):
-                row = idx//cols + 1
-                col = idx%cols + 1
-                val = city_dfs[city]["Wind Chill (°C)"].iloc[hour_idx]
-                color = '#0d3b66' if val<=-20 else '#3f88c5' if val<=0 else '#f4d35e'
-
-                fig_gauge.add_trace(go.Indicator(
-                    mode="gauge+number",
-                    value=val,
-                    number={'suffix':'°C','font':{'size':18}},
-                    gauge={
-                        'axis': {'range':[-40,10]},
-                        'bar': {'color':color},
-                        'steps':[
-                            {'range':[-40,-20],'color':'#0d3b66'},
-                            {'range':[-20,0],'color':'#3f88c5'},
-                            {'range':[0,10],'color':'#f4d35e'}
-                        ],
-                        'threshold': {
-                            'line':{'color':"red",'width':4},
-                            'value':alert_threshold
-                        }
-                    }
-                ), row=row, col=col)
-
-            fig_gauge.update_layout(height=250*rows, title_text=f"Cold Meter – Hour {hour_idx+1}")
-            placeholder_gauge.plotly_chart(fig_gauge, use_container_width=True)
-
-        if st.session_state.page == "City Map":
-            frame_df = pd.DataFrame({
-                "City": multi_cities,
-                "Lat": [CITIES[c][0] for c in multi_cities],
-                "Lon": [CITIES[c][1] for c in multi_cities],
-                "Wind Chill": [city_dfs[c]["Wind Chill (°C)"].iloc[hour_idx] for c in multi_cities]
-            })
-
-            fig_map = go.Figure(go.Scattermapbox(
-                lat=frame_df["Lat"],
-                lon=frame_df["Lon"],
+    def playback_controls(frames):
+        return dict(
+            updatemenus=[{
+                "type": "buttons",
+                "showactive": False,
+                "buttons": [
+                    {"label": "▶", "method": "animate", "args": [None, {**frame_args, "fromcurrent": True}]},
+                    {"label": "❚❚", "method": "animate", "args": [[None], frame_args]}
+                ]
+            }],
+            sliders=[{
+                "currentvalue": {"prefix": "Hour="},
+                "steps": [{"label": f.name, "method": "animate", "args": [[f.name], frame_args]} for f in frames]
+            }]
+        )
+
+    if st.session_state.page == "City Map":
+        # Positions and labels are static, so they live on the base trace once;
+        # each hourly frame only carries the marker colours
+        frames = [
+            go.Frame(data=[go.Scattermapbox(marker=dict(color=wc_mat[:, h]))], name=str(h+1))
+            for h in range(hours)
+        ] if animate else []
+
+        fig_map = go.Figure(
+            data=[go.Scattermapbox(
+                lat=lats,
+                lon=lons,
                 mode="markers+text",
                 marker=dict(
                     size=16,
-                    color=frame_df["Wind Chill"],
+                    color=wc_mat[:, 0 if animate else last_hour],
                     colorscale="RdBu_r",
                     cmin=-40,
                     cmax=10,
                     colorbar=dict(title="Wind Chill °C")
                 ),
-                text=frame_df["City"],
+                text=multi_cities,
                 textposition="top center"
-            ))
+            )],
+            frames=frames
+        )
+
+        fig_map.update_layout(
+            mapbox_style="carto-positron",
+            mapbox_zoom=4.5,
+            mapbox_center={"lat":60,"lon":10},
+            height=400
+        )
+        if animate:
+            fig_map.update_layout(**playback_controls(frames))
+
+        st.plotly_chart(fig_map, use_container_width=True)
+
+    if st.session_state.page == "Multi-city":
+        # All cities share the same Time axis, so one concat lines them up
+        wide = pd.concat({
+            c: city_dfs[c].set_index("Time")[["Temperature (°C)","Wind Chill (°C)"]]
+            for c in multi_cities
+        }, axis=1)
+        metric_names = {"Temperature (°C)": "Temp", "Wind Chill (°C)": "Wind Chill"}
+        wide.columns = [f"{c} {metric_names[m]}" for c, m in wide.columns]
+        times = wide.index
+
+        # Traces carry the full series once; each frame only widens the
+        # visible x range, so the payload stays linear in the forecast length
+        frames = [
+            go.Frame(
+                layout=go.Layout(
+                    title_text=f"Temperature & Wind Chill – Hour {h+1}",
+                    xaxis_range=[times[0], times[h]] if h
+                        else [times[0] - pd.Timedelta(hours=1), times[0]]
+                ),
+                name=str(h+1)
+            )
+            for h in range(len(times))
+        ] if animate else []
+
+        fig_graph = go.Figure(
+            data=[go.Scattergl(x=times, y=wide[col], name=col, mode="lines") for col in wide.columns],
+            frames=frames
+        )
+        fig_graph.update_layout(
+            title_text=f"Temperature & Wind Chill – Hour {len(times)}",
+            xaxis_title="Time",
+            yaxis_title="°C",
+            legend_title_text="Metric"
+        )
+        if animate:
+            # Animations don't re-autorange, so the y axis is fixed to the full forecast
+            values = wide.to_numpy()
+            fig_graph.update_layout(
+                title_text=frames[0].layout.title.text,
+                xaxis_range=frames[0].layout.xaxis.range,
+                yaxis_range=[np.nanmin(values) - 2, np.nanmax(values) + 2],
+                **playback_controls(frames)
+            )
+
+        st.plotly_chart(fig_graph, use_container_width=True)
+
+    if st.session_state.page == "Heatmap":
+        # The full matrix rides on the base trace once; each frame only widens
+        # the visible x range, so the payload stays linear in the forecast length
+        first = 0 if animate else last_hour
+        frames = [
+            go.Frame(
+                layout=go.Layout(
+                    title_text=f"Forecast Progress – Hour {h+1}",
+                    xaxis_range=[-0.5, h+0.5]
+                ),
+                name=str(h+1)
+            )
+            for h in range(hours)
+        ] if animate else []
 
-            fig_map.update_layout(
-                mapbox_style="carto-positron",
-                mapbox_zoom=4.5,
-                mapbox_center={"lat":60,"lon":10},
-                height=400
+        fig_heatmap = go.Figure(
+            data=[go.Heatmap(
+                z=wc_mat,
+                x=hour_labels,
+                y=multi_cities,
+                colorscale="RdBu_r",
+                zmin=-40,
+                zmax=10,
+                colorbar=dict(title="Wind Chill (°C)"),
+                hovertemplate="%{y} · %{x}<br>Wind Chill: %{z:.1f}°C<extra></extra>"
+            )],
+            frames=frames
+        )
+        fig_heatmap.update_layout(
+            title_text=f"Forecast Progress – Hour {first+1}",
+            xaxis_title="Hour",
+            xaxis_range=[-0.5, first+0.5],
+            yaxis_title="City",
+            yaxis_autorange="reversed"
+        )
+        if animate:
+            fig_heatmap.update_layout(**playback_controls(frames))
+
+        st.plotly_chart(fig_heatmap, use_container_width=True)
+
+    if st.session_state.page == "Cold Meter":
+        # Gauge grid is built once; each frame only carries values and bar colours
+        n = len(multi_cities)
+        cols = 3
+        rows = (n+cols-1)//cols
+        fig_gauge = make_subplots(
+            rows=rows,
+            cols=cols,
+            specs=[[{"type":"indicator"}]*cols]*rows,
+            subplot_titles=multi_cities
+        )
+
+        for idx, city in enumerate(multi_cities):
+            row = idx//cols + 1
+            col = idx%cols + 1
+            fig_gauge.add_trace(go.Indicator(
+                mode="gauge+number",
+                number={'suffix':'°C','font':{'size':18}},
+                gauge={
+                    'axis': {'range':[-40,10]},
+                    'steps':[
+                        {'range':[-40,-20],'color':'#0d3b66'},
+                        {'range':[-20,0],'color':'#3f88c5'},
+                        {'range':[0,10],'color':'#f4d35e'}
+                    ],
+                    'threshold': {
+                        'line':{'color':"red",'width':4},
+                        'value':alert_threshold
+                    }
+                }
+            ), row=row, col=col)
+
+        # Bar colour per city and hour: <=-20, <=0, warmer (side="left" keeps the <= edges)
+        colors = GAUGE_PALETTE[np.searchsorted(GAUGE_THRESHOLDS, wc_mat, side="left")]
+
+        def gauge_frame(h):
+            return go.Frame(
+                data=[
+                    go.Indicator(value=val, gauge={'bar': {'color': color}})
+                    for val, color in zip(wc_mat[:, h], colors[:, h])
+                ],
+                traces=list(range(n)),
+                layout=go.Layout(title_text=f"Cold Meter – Hour {h+1}"),
+                name=str(h+1)
             )
 
-            placeholder_map.plotly_chart(fig_map, use_container_width=True)
-
-        with placeholder_tables.container():
-            st.subheader(f"📊 Forecast Tables – Hour {hour_idx+1}")
-            for city in multi_cities:
-                df = city_dfs[city].iloc[:hour_idx+1].copy()
-                with st.expander(f"{city} Forecast (First {hour_idx+1} hours)"):
-                    df_style = df.style.applymap(
-                        lambda x: "background-color:red;color:white;"
-                        if isinstance(x,float) and x<=alert_threshold else "",
-                        subset=["Wind Chill (°C)"]
-                    )
-                    st.dataframe(df_style, use_container_width=True)
-
-        time.sleep(speed)
+        frames = [gauge_frame(h) for h in range(hours)] if animate else []
+        shown = gauge_frame(0 if animate else last_hour)
+        with fig_gauge.batch_update():
+            for trace, update in zip(fig_gauge.data, shown.data):
+                trace.value = update.value
+                trace.gauge.bar.color = update.gauge.bar.color
+            fig_gauge.frames = frames
+            fig_gauge.update_layout(height=250*rows, title_text=shown.layout.title.text)
+            if animate:
+                fig_gauge.update_layout(**playback_controls(frames))
+
+        st.plotly_chart(fig_gauge, use_container_width=True)
+
+    st.subheader(f"📊 Forecast Tables – First {hours} hours")
+    for city in multi_cities:
+        df = city_dfs[city]
+        # Extreme-cold cells from one boolean mask, applied in a single Styler pass
+        styles = pd.DataFrame("", index=df.index, columns=df.columns)
+        styles.loc[df["Wind Chill (°C)"].to_numpy() <= alert_threshold, "Wind Chill (°C)"] = "background-color:red;color:white;"
+        with st.expander(f"{city} Forecast"):
+            st.dataframe(df.style.apply(lambda _: styles, axis=None), use_container_width=True)
 
     st.button("⬅️ Back to Home", on_click=lambda: go_to_page("Home"))
 
@@ -1,11 +1,13 @@
 import time
+import math
 import requests
 import certifi
+import orjson
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import numpy as np
 import pandas as pd
 import streamlit as st
-import plotly.express as px
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 from streamlit_autorefresh import st_autorefresh
 
 # -----------------------------
@@ -58,10 +60,15 @@ footer {visibility: hidden;}       /* hide bottom footer */
 # WIND CHILL FORMULA
 # -----------------------------
 def wind_chill(temp_c, wind_kmh):
-    if temp_c > 10 or wind_kmh < 4.8:
-        return temp_c
-    v = wind_kmh ** 0.16
-    return 13.12 + 0.6215*temp_c - 11.37*v + 0.3965*temp_c*v
+    t = np.asarray(temp_c)
+    w = np.asarray(wind_kmh)
+    # 13.12 + 0.6215T + V^0.16 (0.3965T - 11.37), computed in place
+    wc = np.power(w, 0.16)
+    wc *= 0.3965*t - 11.37
+    wc += 0.6215*t + 13.12
+    out = np.where((t > 10) | (w < 4.8), t, wc)
+    # Behave like a ufunc: arrays in, array out; scalars in, float out
+    return out if out.ndim else out.item()
 
 # -----------------------------
 # CITIES
@@ -98,6 +105,11 @@ CITIES = {
 }
 
 ALL_CITIES = list(CITIES.keys())
+
+# Struct-of-arrays view of CITIES for vectorized lat/lon lookups
+CITY_LAT = np.array([v[0] for v in CITIES.values()], dtype=np.float32)
+CITY_LON = np.array([v[1] for v in CITIES.values()], dtype=np.float32)
+CITY_IDX = {name: i for i, name in enumerate(ALL_CITIES)}
 HOME_DEFAULT = ["Oslo", "Stavanger"]
 
 # -----------------------------
@@ -133,70 +145,183 @@ else:
 # -----------------------------
 # FETCH FORECAST (SSL SAFE)
 # -----------------------------
-@st.cache_data(ttl=900)
-def fetch_forecast(lat, lon):
+# One pooled session so forecast requests reuse a keep-alive TLS connection.
+# Cached as a resource because Streamlit re-executes this script on every rerun.
+@st.cache_resource
+def get_session():
+    session = requests.Session()
+    session.verify = certifi.where()
+    session.mount("https://", HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=16,
+        max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+    ))
+    return session
+
+_SESSION = get_session()
+
+FORECAST_TTL = 900
+
+@st.cache_data(ttl=FORECAST_TTL)
+def fetch_forecast_batch(coords, forecast_days, bucket):
+    # Open-Meteo accepts comma-separated coordinates and answers with one
+    # forecast per location, in request order. Only ask for the days the
+    # hours slider can reach instead of the 7-day default.
+    lats = ",".join(str(lat) for lat, _ in coords)
+    lons = ",".join(str(lon) for _, lon in coords)
     url = (
         f"https://api.open-meteo.com/v1/forecast"
-        f"?latitude={lat}&longitude={lon}"
+        f"?latitude={lats}&longitude={lons}"
         "&hourly=temperature_2m,windspeed_10m&timezone=auto"
+        f"&forecast_days={forecast_days}"
     )
     try:
-        r = requests.get(url, timeout=15, verify=certifi.where())
-        r.raise_for_status()
-        return r.json()
+        r = _SESSION.get(url, timeout=15)
     except requests.exceptions.SSLError:
-        r = requests.get(url, timeout=15, verify=False)
-        r.raise_for_status()
-        return r.json()
-
-city_dfs = {}
-for city in multi_cities:
-    lat, lon = CITIES[city]
-    data = fetch_forecast(lat, lon)
+        r = _SESSION.get(url, timeout=15, verify=False)
+    r.raise_for_status()
+    data = orjson.loads(r.content)
+    # A single location comes back as a bare object rather than a list
+    return data if isinstance(data, list) else [data]
+
+def forecast_df(data, hours):
+    # Open-Meteo reports tenths of a degree, so float32 loses nothing
     df = pd.DataFrame({
         "Time": data["hourly"]["time"][:hours],
-        "Temperature (°C)": data["hourly"]["temperature_2m"][:hours],
-        "Wind Speed (km/h)": data["hourly"]["windspeed_10m"][:hours]
+        "Temperature (°C)": np.asarray(data["hourly"]["temperature_2m"][:hours], dtype=np.float32),
+        "Wind Speed (km/h)": np.asarray(data["hourly"]["windspeed_10m"][:hours], dtype=np.float32)
     })
-    df["Wind Chill (°C)"] = df.apply(
-        lambda r: wind_chill(r["Temperature (°C)"], r["Wind Speed (km/h)"]),
-        axis=1
+    df["Wind Chill (°C)"] = wind_chill(
+        df["Temperature (°C)"].values,
+        df["Wind Speed (km/h)"].values
     )
-    city_dfs[city] = df
+    return df.set_index("Time")
+
+@st.cache_data(ttl=FORECAST_TTL, show_spinner=False)
+def build_city_dfs(cities, hours, bucket):
+    forecasts = fetch_forecast_batch(tuple(CITIES[c] for c in cities), math.ceil(hours/24), bucket)
+    return {city: forecast_df(data, hours) for city, data in zip(cities, forecasts)}
+
+# One request for every selected city; sorted so the cache key ignores selection order.
+# Both cache layers are keyed on the same TTL bucket, so a fresh frame can
+# never be built from a fetch left over from the previous bucket.
+forecast_bucket = int(time.time() // FORECAST_TTL)
+city_dfs = build_city_dfs(tuple(sorted(multi_cities)), hours, forecast_bucket) if multi_cities else {}
+
+# Hours x cities matrices shared by the dashboards; column-major so each
+# city's series is contiguous
+def city_matrix(column):
+    return np.asfortranarray(
+        np.stack([city_dfs[c][column].values for c in multi_cities], axis=1)
+        if multi_cities else np.empty((hours, 0), dtype=np.float32)
+    )
+
+t_mat = city_matrix("Temperature (°C)")
+wc_mat = city_matrix("Wind Chill (°C)")
+last_wc = wc_mat[-1] if len(wc_mat) else np.empty(0, dtype=np.float32)
+
+# -----------------------------
+# GAUGE COLORS
+# -----------------------------
+GAUGE_THRESHOLDS = np.array([-20, 0])
+GAUGE_PALETTE = np.array(['#0d3b66', '#3f88c5', '#f4d35e'])
+
+# -----------------------------
+# LEADERBOARD COLORS
+# -----------------------------
+@st.cache_resource
+def blues_r_lut():
+    from matplotlib import colormaps
+    # 256-step Blues_r lookup table with the same light/dark text switch
+    # that Styler.background_gradient applies
+    rgb = colormaps["Blues_r"](np.linspace(0, 1, 256))[:, :3]
+    lin = np.where(rgb <= 0.04045, rgb/12.92, ((rgb + 0.055)/1.055)**2.4)
+    luminance = lin @ np.array([0.2126, 0.7152, 0.0722])
+    hexes = ["#{:02x}{:02x}{:02x}".format(*c) for c in np.round(rgb*255).astype(int)]
+    return np.array([
+        f"background-color: {h}; color: {'#f1f1f1' if lum < 0.408 else '#000000'};"
+        for h, lum in zip(hexes, luminance)
+    ])
+
+def gradient(col):
+    wc = col.to_numpy(dtype=np.float64)
+    span = np.nanmax(wc) - np.nanmin(wc) if len(wc) else 0
+    norm = (wc - np.nanmin(wc))/span if span else np.zeros_like(wc)
+    idx = np.clip(np.nan_to_num(norm)*256, 0, 255).astype(np.intp)
+    return np.where(np.isnan(wc), "", blues_r_lut()[idx])
 
 # -----------------------------
 # HOME — MULTI CITY COMPARISON WITH MOVING GRAPH
 # -----------------------------
 if page == "Home":
+    import plotly.graph_objects as go
     st.title("❄ Multi-City Comparison Norway - Default Cities: Oslo & Stavanger")
 
-    placeholder_graph = st.empty()  # placeholder for animation
-
-    # Determine total hours to animate
-    total_hours = hours
-
-    for hour_idx in range(total_hours):
-        compare_df = pd.DataFrame()
-        for city in multi_cities:
-            df = city_dfs[city][["Time","Temperature (°C)","Wind Chill (°C)"]].iloc[:hour_idx+1]
-            df = df.rename(columns={
-                "Temperature (°C)": f"{city} Temp",
-                "Wind Chill (°C)": f"{city} Wind Chill"
-            })
-            compare_df = df if compare_df.empty else compare_df.merge(df,on="Time")
-
-        if not compare_df.empty:
-            fig_graph = px.line(
-                compare_df,
-                x="Time",
-                y=compare_df.columns[1:],
-                labels={"value":"°C","variable":"Metric"},
-                title=f"Temperature & Wind Chill – Hour {hour_idx+1}"
+    # Every city shares the same Time index, so a single concat lines them up
+    parts = [
+        city_dfs[city][["Temperature (°C)","Wind Chill (°C)"]].rename(columns={
+            "Temperature (°C)": f"{city} Temp",
+            "Wind Chill (°C)": f"{city} Wind Chill"
+        })
+        for city in multi_cities
+    ]
+
+    if parts:
+        compare_df = pd.concat(parts, axis=1).reset_index()
+        metrics = compare_df.columns[1:]
+        values = compare_df[metrics].values
+
+        # One frame per hour; the browser plays them, so the script never sleeps.
+        # The chart opens on the full forecast and Play replays it from hour 1.
+        # Traces carry the full series once and each frame only widens the
+        # visible x range, so the payload stays linear in the forecast length.
+        times = pd.to_datetime(compare_df["Time"])
+        frames = [
+            go.Frame(
+                layout=go.Layout(
+                    title_text=f"Temperature & Wind Chill – Hour {hour_idx+1}",
+                    xaxis_range=[times.iloc[0], times.iloc[hour_idx]] if hour_idx
+                        else [times.iloc[0] - pd.Timedelta(hours=1), times.iloc[0]]
+                ),
+                name=str(hour_idx)
             )
-            placeholder_graph.plotly_chart(fig_graph, use_container_width=True)
+            for hour_idx in range(len(compare_df))
+        ]
+        frame_args = {
+            "frame": {"duration": int(speed*1000), "redraw": True},
+            "transition": {"duration": 0},
+            "mode": "immediate"
+        }
+
+        fig_graph = go.Figure(
+            data=[go.Scattergl(x=times, y=compare_df[col], name=col, mode="lines") for col in metrics],
+            frames=frames
+        )
 
-        # Sleep according to speed slider
-        time.sleep(speed)
+        # Animations don't re-autorange, so the y axis is fixed to the full forecast
+        fig_graph.update_layout(
+            title_text=frames[-1].layout.title.text,
+            xaxis=dict(title="Time", range=frames[-1].layout.xaxis.range),
+            yaxis=dict(title="°C", range=[np.nanmin(values) - 2, np.nanmax(values) + 2]),
+            legend_title_text="Metric",
+            updatemenus=[{
+                "type": "buttons",
+                "showactive": False,
+                "buttons": [
+                    {"label": "▶ Play", "method": "animate", "args": [None, {**frame_args, "fromcurrent": False}]},
+                    {"label": "⏸ Pause", "method": "animate", "args": [[None], frame_args]}
+                ]
+            }],
+            sliders=[{
+                "active": len(frames)-1,
+                "currentvalue": {"prefix": "Hour "},
+                "steps": [
+                    {"label": str(hour_idx+1), "method": "animate", "args": [[str(hour_idx)], frame_args]}
+                    for hour_idx in range(len(frames))
+                ]
+            }]
+        )
+        st.plotly_chart(fig_graph, use_container_width=True)
 
 
 # -----------------------------
@@ -207,13 +332,13 @@ elif page == "Leaderboard":
     latest_hour = hours-1
     leaderboard_df = pd.DataFrame({
         "City": multi_cities,
-        "Temperature (°C)": [city_dfs[c]["Temperature (°C)"].iloc[latest_hour] for c in multi_cities],
-        "Wind Chill (°C)": [city_dfs[c]["Wind Chill (°C)"].iloc[latest_hour] for c in multi_cities]
+        "Temperature (°C)": t_mat[latest_hour],
+        "Wind Chill (°C)": wc_mat[latest_hour]
     }).sort_values(by="Wind Chill (°C)")
 
     st.dataframe(
         leaderboard_df.style
-            .background_gradient(subset=["Wind Chill (°C)"], cmap="Blues_r")
+            .apply(gradient, subset=["Wind Chill (°C)"])
             .format({"Temperature (°C)": "{:.1f}", "Wind Chill (°C)": "{:.1f}"}),
         use_container_width=True
     )
@@ -222,78 +347,127 @@ elif page == "Leaderboard":
 # HEATMAP
 # -----------------------------
 elif page == "Heatmap":
+    import plotly.graph_objects as go
 
     st.title("📊 Wind Chill Heatmap (Forecast)")
 
-    heatmap_placeholder = st.empty()
-
-    for hour_idx in range(hours):
-
-        # Build dataframe up to current hour
-        z = pd.DataFrame({
-            city: city_dfs[city]["Wind Chill (°C)"].iloc[:hour_idx+1]
-            for city in multi_cities
-        })
-
-        fig_heatmap = px.imshow(
-            z.T,
-            labels=dict(x="Hour", y="City", color="Wind Chill (°C)"),
-            x=[f"H{h+1}" for h in range(hour_idx+1)],
-            y=multi_cities,
-            color_continuous_scale="RdBu_r",
-            aspect="auto",
-            title=f"Forecast Progress — Hour {hour_idx+1}"
+    hour_labels = [f"H{h+1}" for h in range(hours)]
+
+    # The full matrix goes to the browser once; each hourly frame only widens
+    # the visible x range, so playback never sleeps and the payload stays
+    # linear in the forecast length. It opens on the last hour, like Home.
+    frames = [
+        go.Frame(
+            layout=go.Layout(
+                title_text=f"Forecast Progress — Hour {hour_idx+1}",
+                xaxis_range=[-0.5, hour_idx+0.5]
+            ),
+            name=str(hour_idx)
         )
-
-        heatmap_placeholder.plotly_chart(fig_heatmap, use_container_width=True)
-
-        time.sleep(speed)
+        for hour_idx in range(hours)
+    ]
+    frame_args = {
+        "frame": {"duration": int(speed*1000), "redraw": True},
+        "transition": {"duration": 0},
+        "mode": "immediate"
+    }
+
+    fig_heatmap = go.Figure(
+        data=[go.Heatmap(
+            z=wc_mat.T,
+            x=hour_labels,
+            y=multi_cities,
+            colorscale="RdBu_r",
+            zmin=-40,
+            zmax=10,
+            colorbar=dict(title="Wind Chill (°C)"),
+            # Formatted in the browser, so no per-cell hover strings are built here
+            hovertemplate="%{y} · %{x}<br>Wind Chill: %{z:.1f}°C<extra></extra>"
+        )],
+        frames=frames
+    )
+    fig_heatmap.update_layout(
+        title_text=frames[-1].layout.title.text,
+        xaxis=dict(title="Hour", range=frames[-1].layout.xaxis.range),
+        yaxis=dict(title="City", autorange="reversed"),
+        updatemenus=[{
+            "type": "buttons",
+            "showactive": False,
+            "buttons": [
+                {"label": "▶ Play", "method": "animate", "args": [None, {**frame_args, "fromcurrent": False}]},
+                {"label": "⏸ Pause", "method": "animate", "args": [[None], frame_args]}
+            ]
+        }],
+        sliders=[{
+            "active": len(frames)-1,
+            "currentvalue": {"prefix": "Hour "},
+            "steps": [
+                {"label": str(hour_idx+1), "method": "animate", "args": [[str(hour_idx)], frame_args]}
+                for hour_idx in range(len(frames))
+            ]
+        }]
+    )
+    st.plotly_chart(fig_heatmap, use_container_width=True)
 
 
 # -----------------------------
 # COLD METER
 # -----------------------------
 elif page == "Cold Meter":
-    n = len(multi_cities)
-    cols = 3
-    rows = (n+cols-1)//cols
-    fig_gauge = make_subplots(
-        rows=rows, cols=cols,
-        specs=[[{"type":"indicator"}]*cols]*rows,
-        subplot_titles=multi_cities
-    )
-    for idx, city in enumerate(multi_cities):
-        row = idx//cols + 1
-        col = idx%cols + 1
-        val = city_dfs[city]["Wind Chill (°C)"].iloc[-1]
-        color = '#0d3b66' if val<=-20 else '#3f88c5' if val<=0 else '#f4d35e'
-        fig_gauge.add_trace(go.Indicator(
-            mode="gauge+number",
-            value=val,
-            number={'suffix':'°C','font':{'size':18}},
-            gauge={
-                'axis': {'range':[-40,10]},
-                'bar': {'color':color},
-                'steps':[
-                    {'range':[-40,-20],'color':'#0d3b66'},
-                    {'range':[-20,0],'color':'#3f88c5'},
-                    {'range':[0,10],'color':'#f4d35e'}
-                ],
-                'threshold': {'line':{'color':"red",'width':4},'value':alert_threshold}
-            }
-        ), row=row, col=col)
-    fig_gauge.update_layout(height=250*rows, title_text="Cold Meter")
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+    # The gauge grid only depends on the cities and threshold, so keep it in
+    # session state across auto-refreshes and only swap in new readings
+    gauge_key = (tuple(multi_cities), alert_threshold)
+    if st.session_state.get("gauge_key") != gauge_key:
+        n = len(multi_cities)
+        cols = 3
+        rows = (n+cols-1)//cols
+        fig_gauge = make_subplots(
+            rows=rows, cols=cols,
+            specs=[[{"type":"indicator"}]*cols]*rows,
+            subplot_titles=multi_cities
+        )
+        for idx, city in enumerate(multi_cities):
+            row = idx//cols + 1
+            col = idx%cols + 1
+            fig_gauge.add_trace(go.Indicator(
+                mode="gauge+number",
+                number={'suffix':'°C','font':{'size':18}},
+                gauge={
+                    'axis': {'range':[-40,10]},
+                    'steps':[
+                        {'range':[-40,-20],'color':'#0d3b66'},
+                        {'range':[-20,0],'color':'#3f88c5'},
+                        {'range':[0,10],'color':'#f4d35e'}
+                    ],
+                    'threshold': {'line':{'color':"red",'width':4},'value':alert_threshold}
+                }
+            ), row=row, col=col)
+        fig_gauge.update_layout(height=250*rows, title_text="Cold Meter")
+        st.session_state.gauge_key = gauge_key
+        st.session_state.gauge_fig = fig_gauge
+
+    fig_gauge = st.session_state.gauge_fig
+    # Bucket index per city: <=-20, <=0, warmer (side="left" keeps the <= edges)
+    colors = GAUGE_PALETTE[np.searchsorted(GAUGE_THRESHOLDS, last_wc, side="left")]
+    with fig_gauge.batch_update():
+        for trace, val, color in zip(fig_gauge.data, last_wc, colors):
+            trace.value = val
+            trace.gauge.bar.color = color
     st.plotly_chart(fig_gauge, use_container_width=True)
 
 # -----------------------------
 # CITY MAP
 # -----------------------------
 elif page == "City Map":
+    import plotly.graph_objects as go
+    idx = np.array([CITY_IDX[c] for c in multi_cities], dtype=np.intp)
     frame_df = pd.DataFrame({
         "City": multi_cities,
-        "Lat": [CITIES[c][0] for c in multi_cities],
-        "Lon": [CITIES[c][1] for c in multi_cities],
-        "Wind Chill": [city_dfs[c]["Wind Chill (°C)"].iloc[-1] for c in multi_cities]
+        "Lat": CITY_LAT[idx],
+        "Lon": CITY_LON[idx],
+        "Wind Chill": last_wc
     })
     fig_map = go.Figure(go.Scattermapbox(
         lat=frame_df["Lat"],
@@ -319,13 +493,17 @@ elif page == "City Map":
     st.plotly_chart(fig_map, use_container_width=True)
 
 # -----------------------------
-# FORECAST TABLES (EXPANDED)
+# FORECAST TABLES (COLLAPSED)
 # -----------------------------
+def highlight_extreme(col):
+    return np.where(col <= alert_threshold, "background-color:red;color:white;", "")
+
 st.subheader("📊 Forecast Tables")
 for city in multi_cities:
-    st.markdown(f"### {city}")
-    df_style = city_dfs[city].style.applymap(
-        lambda x: "background-color:red;color:white;" if isinstance(x,float) and x<=alert_threshold else "",
-        subset=["Wind Chill (°C)"]
-    )
-    st.dataframe(df_style, use_container_width=True)
+    with st.expander(f"📊 {city} Forecast", expanded=False):
+        df_style = (
+            city_dfs[city].style
+                .apply(highlight_extreme, subset=["Wind Chill (°C)"])
+                .format("{:.1f}")
+        )
+        st.dataframe(df_style, use_container_width=True)